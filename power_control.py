@@ -7,15 +7,18 @@ import apscheduler.schedulers.blocking
 import boto3
 import botocore.exceptions
 import collections
+import concurrent.futures
+import contextlib
 import datetime
 import email.message
 import enum
+import functools
 import jinja2
 import json
 import logging
 import os
 import pathlib
-import pytz
+import re
 import signal
 import smtplib
 import sys
@@ -25,9 +28,11 @@ log = logging.getLogger(__name__)
 if __name__ == '__main__':
     log = logging.getLogger('power_control')
 
+# the day range tolerates the whitespace, plus signs, and leading zeros that int() accepts
+schedule_pattern = re.compile(r'([0-9]{2}):([0-9]{2}):([0-9]{2}):([0-9]{2}):\s*\+?0*([1-7])\s*-\s*\+?0*([1-7])\s*')
+
 
 class PowerControlReason(enum.Enum):
-    NOT_RUNNING = enum.auto()
     MALFORMED = enum.auto()
     DAY_MISMATCH = enum.auto()
     TIME_MISMATCH = enum.auto()
@@ -40,12 +45,14 @@ class PowerControlReason(enum.Enum):
 class Config:
     admin_email: str
     aws_ses_configuration_set: str
+    aws_ses_region: str
+    aws_ses_template: str
     dry_run: bool
     immediate: bool
     log_format: str
     log_level: str
     notification_wait_hours: int
-    protected_owners: list[str]
+    protected_owners: frozenset[str]
     send_email: bool
     smtp_from: str
     smtp_host: str
@@ -60,12 +67,14 @@ class Config:
         true_values = ('true', 'yes', 'on', '1')
         self.admin_email = os.getenv('ADMIN_EMAIL')
         self.aws_ses_configuration_set = os.getenv('AWS_SES_CONFIGURATION_SET')
+        self.aws_ses_region = os.getenv('AWS_SES_REGION')
+        self.aws_ses_template = os.getenv('AWS_SES_TEMPLATE')
         self.dry_run = os.getenv('DRY_RUN', 'true').lower() in true_values
         self.immediate = os.getenv('IMMEDIATE', 'true').lower() in true_values
         self.log_format = os.getenv('LOG_FORMAT', '%(levelname)s [%(name)s] %(message)s')
         self.log_level = os.getenv('LOG_LEVEL', 'INFO')
         self.notification_wait_hours = int(os.getenv('NOTIFICATION_WAIT_HOURS', 12))
-        self.protected_owners = [o.strip().lower() for o in os.getenv('PROTECTED_OWNERS', '').split(',') if o]
+        self.protected_owners = frozenset(o.strip().lower() for o in os.getenv('PROTECTED_OWNERS', '').split(',') if o)
         self.send_email = os.getenv('SEND_EMAIL', 'false').lower() in true_values
         self.smtp_from = os.getenv('SMTP_FROM')
         self.smtp_host = os.getenv('SMTP_HOST')
@@ -75,176 +84,260 @@ class Config:
         self.tracking_file = os.getenv('TRACKING_FILE', '/data/power-control.json')
         self.tz = os.getenv('TZ', 'Etc/UTC')
         self.version = os.getenv('APP_VERSION', 'unknown')
+        self._notification_times = None
 
     @property
     def notification_times(self) -> dict[str, datetime.datetime]:
-        raw_data = {}
-        path = pathlib.Path(self.tracking_file)
-        if path.exists():
-            with path.open() as f:
-                raw_data = json.load(f)
-        return {key: datetime.datetime.fromisoformat(value).astimezone(pytz.utc) for key, value in raw_data.items()}
+        # The tracking file is only read once, after that we keep our own copy of the data in memory
+        if self._notification_times is None:
+            raw_data = {}
+            path = pathlib.Path(self.tracking_file)
+            if path.exists():
+                with path.open() as f:
+                    raw_data = json.load(f)
+            self._notification_times = {key: datetime.datetime.fromisoformat(value) for key, value in raw_data.items()}
+        return self._notification_times
 
     @notification_times.setter
     def notification_times(self, data: dict[str, datetime.datetime]):
+        self._notification_times = data
+        # Write to a temporary file and move it into place so a crash never leaves a partially written tracking file
         path = pathlib.Path(self.tracking_file)
-        with path.open('w') as f:
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        with tmp_path.open('w') as f:
             json.dump({key: value.isoformat() for key, value in data.items()}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
 
 
 c = Config()
-jinja_env = jinja2.Environment(trim_blocks=True, lstrip_blocks=True, loader=jinja2.FileSystemLoader(c.template_path))
+jinja_env = jinja2.Environment(trim_blocks=True, lstrip_blocks=True, loader=jinja2.FileSystemLoader(c.template_path),
+                               auto_reload=False, cache_size=400)
+
+
+@contextlib.contextmanager
+def smtp_session():
+    """Open one logged-in SMTP connection to be shared by several calls to send_email. Yield None if sending email is
+    disabled."""
+    if not c.send_email:
+        yield None
+        return
+    with smtplib.SMTP_SSL(host=c.smtp_host) as s:
+        s.login(user=c.smtp_username, password=c.smtp_password)
+        yield s
 
 
-def send_email(from_addr, to_addr, subject, body) -> bool:
-    """Send an email. Return True if successful, False if not."""
+def send_email(from_addr, to_addr, subject, body, conn: smtplib.SMTP | None = None) -> bool:
+    """Send an email. Return True if successful, False if not. If conn is given, send over that connection instead of
+    opening a new one."""
     if c.send_email:
-        log.warning(f'Sending email to {to_addr}')
+        log.warning('Sending email to %s', to_addr)
         msg = email.message.EmailMessage()
         msg['X-SES-CONFIGURATION-SET'] = c.aws_ses_configuration_set
         msg['Subject'] = subject
         msg['From'] = from_addr
         msg['To'] = to_addr
         msg.set_content(body, subtype='html')
-        with smtplib.SMTP_SSL(host=c.smtp_host) as s:
-            s.login(user=c.smtp_username, password=c.smtp_password)
+        with contextlib.ExitStack() as stack:
+            if conn is None:
+                conn = stack.enter_context(smtp_session())
             try:
-                s.send_message(msg)
+                conn.send_message(msg)
             except smtplib.SMTPRecipientsRefused as e:
-                log.error(f'{e}')
+                log.error(e)
                 return False
     else:
-        log.warning(f'Not sending email to {to_addr}\n{body}')
+        log.warning('Not sending email to %s\n%s', to_addr, body)
     return True
 
 
-def parse_schedule(schedule: str):
-    tokens = schedule.split(':')
+def send_bulk_email(from_addr, messages: dict[str, str], subject) -> dict[str, bool]:
+    """Send emails through the SES API, up to 50 recipients per request. messages maps each recipient to the body of
+    their email. Return a dict that maps each recipient to True if successful, False if not.
 
-    # the schedule must have only 5 fields
-    if not len(tokens) == 5:
-        return False
+    AWS_SES_TEMPLATE must name an SES template in AWS_SES_REGION with subject {{subject}} and HTML part {{{body}}}."""
+    if not c.send_email:
+        for to_addr, body in messages.items():
+            log.warning('Not sending email to %s\n%s', to_addr, body)
+        return dict.fromkeys(messages, True)
+
+    results = {}
+    to_addrs = []
+    for to_addr in messages:
+        if to_addr:
+            to_addrs.append(to_addr)
+        else:
+            log.error('Not sending email with no recipient')
+            results[to_addr] = False
 
-    # the first 4 fields must be 2 valid 24h times
     try:
-        start_time = datetime.time.fromisoformat(f'{tokens[0]}:{tokens[1]}')
-        stop_time = datetime.time.fromisoformat(f'{tokens[2]}:{tokens[3]}')
-    except ValueError:
+        ses = boto3.client('sesv2', region_name=c.aws_ses_region)
+    except botocore.exceptions.BotoCoreError as e:
+        log.error(e)
+        results.update(dict.fromkeys(to_addrs, False))
+        return results
+
+    default_content = {
+        'Template': {
+            'TemplateName': c.aws_ses_template,
+            'TemplateData': json.dumps({'subject': subject, 'body': ''}),
+        },
+    }
+    optional_params = {}
+    if c.aws_ses_configuration_set:
+        optional_params['ConfigurationSetName'] = c.aws_ses_configuration_set
+
+    for i in range(0, len(to_addrs), 50):
+        batch = to_addrs[i:i + 50]
+        log.warning('Sending email to %s', ', '.join(map(str, batch)))
+        entries = []
+        for to_addr in batch:
+            template_data = json.dumps({'subject': subject, 'body': messages[to_addr]})
+            entries.append({
+                'Destination': {'ToAddresses': [to_addr]},
+                'ReplacementEmailContent': {'ReplacementTemplate': {'ReplacementTemplateData': template_data}},
+            })
+        try:
+            response = ses.send_bulk_email(FromEmailAddress=from_addr, DefaultContent=default_content,
+                                           BulkEmailEntries=entries, **optional_params)
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError) as e:
+            log.error(e)
+            results.update(dict.fromkeys(batch, False))
+            continue
+        for to_addr, entry in zip(batch, response['BulkEmailEntryResults']):
+            if entry['Status'] == 'SUCCESS':
+                results[to_addr] = True
+            else:
+                log.error('%s: %s: %s', to_addr, entry['Status'], entry.get('Error'))
+                results[to_addr] = False
+    return results
+
+
+@functools.lru_cache(maxsize=2048)
+def parse_schedule(schedule: str):
+    # the schedule must be 2 24h times followed by a range of days, like 08:00:18:00:1-5
+    m = schedule_pattern.fullmatch(schedule)
+    if m is None:
         return False
 
-    # the start time must be before the stop time
-    if start_time >= stop_time:
+    start_hour, start_minute, stop_hour, stop_minute, first_day, last_day = map(int, m.groups())
+    if start_hour > 23 or stop_hour > 23 or start_minute > 59 or stop_minute > 59:
         return False
 
-    # the last field must have 1 hyphen
-    day_tokens = tokens[4].split('-')
-    if not len(day_tokens) == 2:
-        return False
+    start_time = datetime.time(start_hour, start_minute)
+    stop_time = datetime.time(stop_hour, stop_minute)
 
-    # the first day and last day must be integers
-    try:
-        first_day = int(day_tokens[0])
-        last_day = int(day_tokens[1])
-    except ValueError:
+    # the start time must be before the stop time
+    if start_time >= stop_time:
         return False
 
     # the first day must be less than or equal to the last day
     if last_day < first_day:
         return False
 
-    # the first day and last day must be between 1 and 7
-    if first_day < 1 or first_day > 7 or last_day < 1 or last_day > 7:
-        return False
-
     return start_time, stop_time, first_day, last_day
 
 
-def get_tag(instance, tag_key):
-    if instance.tags is None:
-        return ''
-    for tag in instance.tags:
-        if tag['Key'] == tag_key:
-            return tag['Value']
-    return ''
+@functools.cache
+def get_zone(name: str) -> zoneinfo.ZoneInfo | None:
+    """Return the time zone with this name, or None if it is not valid. Results are cached so each zone is only loaded
+    once."""
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        return None
+
+
+def tag_map(instance: dict) -> dict[str, str]:
+    return {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
 
 
-def get_instance_owner(instance):
-    return get_tag(instance, 'OWNEREMAIL').strip().lower() or '(no owner)'
+def get_tag(tags: dict[str, str], tag_key):
+    return tags.get(tag_key, '')
 
 
-def get_running_schedule(instance):
-    return get_tag(instance, 'RUNNINGSCHEDULE') or '(no schedule)'
+def get_instance_owner(tags):
+    return get_tag(tags, 'OWNEREMAIL').strip().lower() or '(no owner)'
 
 
-def get_running_schedule_tz(instance) -> str:
-    return get_tag(instance, 'RUNNINGSCHEDULE_TZ') or c.tz
+def get_running_schedule(tags):
+    return get_tag(tags, 'RUNNINGSCHEDULE') or '(no schedule)'
 
 
-def instance_is_running(instance):
-    return instance.state['Name'] == 'running'
+def get_running_schedule_tz(tags) -> str:
+    return get_tag(tags, 'RUNNINGSCHEDULE_TZ') or c.tz
 
 
-def get_instance_name(instance):
-    return get_tag(instance, 'Name') or '(no name)'
+def get_instance_name(tags):
+    return get_tag(tags, 'Name') or '(no name)'
 
 
-def get_instance_dict(instance, region):
+def get_instance_dict(instance: dict, tags: dict[str, str], region):
     return {
-        'id': instance.id,
-        'name': get_instance_name(instance),
-        'owner': get_instance_owner(instance),
+        'id': instance['InstanceId'],
+        'name': get_instance_name(tags),
+        'owner': get_instance_owner(tags),
         'region': region,
-        'running_schedule': get_running_schedule(instance),
-        'running_schedule_tz': get_running_schedule_tz(instance),
+        'running_schedule': get_running_schedule(tags),
+        'running_schedule_tz': get_running_schedule_tz(tags),
     }
 
 
-def do_power_control(instance) -> PowerControlReason:
-    if not instance_is_running(instance):
-        log.info(f'{instance.id}: skip: not running')
-        return PowerControlReason.NOT_RUNNING
+def get_local_day_and_time(now: datetime.datetime, zone_name: str) -> tuple[int, datetime.time] | None:
+    """Convert now to the named time zone and return the ISO weekday and time of day there, or None if the zone is not
+    valid."""
+    z = get_zone(zone_name)
+    if z is None:
+        return None
+    now_in_zone = now.astimezone(z)
+    return now_in_zone.isoweekday(), now_in_zone.time()
+
+
+def do_power_control(instance: dict, tags: dict[str, str],
+                     local_day_and_time: tuple[int, datetime.time] | None) -> PowerControlReason:
+    # instance is the dict from get_instance_dict, so tag values it already holds are not looked up again
+    # local_day_and_time is the current day and time in the instance's RUNNINGSCHEDULE_TZ, see get_local_day_and_time
+    instance_id = instance['id']
 
-    owner = get_instance_owner(instance)
+    owner = instance['owner']
     if owner == '(no owner)':
-        log.info(f'{instance.id}: skip: no owner to notify')
+        log.info('%s: skip: no owner to notify', instance_id)
         return PowerControlReason.NO_OWNER
 
     if owner in c.protected_owners:
-        log.info(f'{instance.id}: skip: owner is protected: {owner}')
+        log.info('%s: skip: owner is protected: %s', instance_id, owner)
         return PowerControlReason.PROTECTED_OWNER
 
-    running_schedule = get_running_schedule(instance)
+    running_schedule = get_tag(tags, 'RUNNINGSCHEDULE')
+    if not running_schedule:
+        log.info('%s: skip: missing RUNNINGSCHEDULE', instance_id)
+        return PowerControlReason.MALFORMED
+
     schedule = parse_schedule(running_schedule)
 
     if not schedule:
-        log.info(f'{instance.id}: skip: malformed RUNNINGSCHEDULE: {running_schedule!r}')
+        log.info('%s: skip: malformed RUNNINGSCHEDULE: %r', instance_id, running_schedule)
         return PowerControlReason.MALFORMED
 
     start_time, stop_time, first_day, last_day = schedule
 
-    now = datetime.datetime.now(datetime.UTC)
-    schedule_tz = get_running_schedule_tz(instance)
-    try:
-        z = zoneinfo.ZoneInfo(schedule_tz)
-    except zoneinfo.ZoneInfoNotFoundError:
-        log.warning(f'{instance.id}: skip: invalid RUNNINGSCHEDULE_TZ: {schedule_tz!r}')
+    schedule_tz = instance['running_schedule_tz']
+    if local_day_and_time is None:
+        log.warning('%s: skip: invalid RUNNINGSCHEDULE_TZ: %r', instance_id, schedule_tz)
         return PowerControlReason.INVALID_ZONE
 
-    now_in_zone = now.astimezone(z)
-    current_day = now_in_zone.isoweekday()
-    current_time = now_in_zone.time()
-    full_sched = f'{running_schedule} {schedule_tz}'
+    current_day, current_time = local_day_and_time
 
     if current_day < first_day or current_day > last_day:
-        log.warning(f'{instance.id}: stop: current day ({current_day}) is outside RUNNINGSCHEDULE: {full_sched}')
+        log.warning('%s: stop: current day (%s) is outside RUNNINGSCHEDULE: %s %s', instance_id, current_day,
+                    running_schedule, schedule_tz)
         return PowerControlReason.DAY_MISMATCH
 
     if current_time < start_time or current_time > stop_time:
-        ct = current_time.isoformat('minutes')
-        log.warning(f'{instance.id}: stop: current time ({ct}) is outside RUNNINGSCHEDULE: {full_sched}')
+        log.warning('%s: stop: current time (%s) is outside RUNNINGSCHEDULE: %s %s', instance_id,
+                    current_time.isoformat('minutes'), running_schedule, schedule_tz)
         return PowerControlReason.TIME_MISMATCH
 
-    log.info(f'{instance.id}: skip: allowed at this day/time: {full_sched}')
+    log.info('%s: skip: allowed at this day/time: %s %s', instance_id, running_schedule, schedule_tz)
     return PowerControlReason.ALLOWED
 
 
@@ -267,7 +360,7 @@ def process_notification_times(instances: list[dict], utc_now: datetime.datetime
     for instance in instances:
         instance_id = instance['id']
         if instance_id in notification_times_pruned:
-            log.warning(f'{instance_id}: will be stopped but not notified!')
+            log.warning('%s: will be stopped but not notified!', instance_id)
         else:
             notification_times_pruned[instance_id] = utc_now
             new_list.append(instance)
@@ -276,22 +369,47 @@ def process_notification_times(instances: list[dict], utc_now: datetime.datetime
     return new_list
 
 
-def group_by_region(instances: list[dict]) -> dict[str, list[dict]]:
+def group_by(instances: list[dict], key: str) -> dict[str, list[dict]]:
     result = collections.defaultdict(list)
     for instance in instances:
-        region_instances = result[instance['region']]
-        region_instances.append(instance)
-        result[instance['region']] = region_instances
+        result[instance[key]].append(instance)
     return result
 
 
-def group_by_owner(instances: list[dict]) -> dict[str, list[dict]]:
-    result = collections.defaultdict(list)
-    for instance in instances:
-        owner_instances = result[instance['owner']]
-        owner_instances.append(instance)
-        result[instance['owner']] = owner_instances
-    return result
+def scan_region(region: str, now: datetime.datetime) -> list[tuple[PowerControlReason, dict]]:
+    # boto3 sessions are not thread-safe, so each worker builds its own
+    log.info('Checking %s', region)
+    ec2 = boto3.session.Session().client('ec2', region_name=region)
+    paginator = ec2.get_paginator('describe_instances')
+    pages = paginator.paginate(
+        Filters=[
+            {'Name': 'instance-state-name', 'Values': ['running']},
+            {'Name': 'tag-key', 'Values': ['RUNNINGSCHEDULE']},
+        ],
+        PaginationConfig={'PageSize': 1000},
+    )
+    results = []
+    # most instances share a few time zones, so only convert now once for each zone
+    local_times = {}
+    for page in pages:
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                tags = tag_map(instance)
+                instance_dict = get_instance_dict(instance, tags, region)
+                schedule_tz = instance_dict['running_schedule_tz']
+                if schedule_tz not in local_times:
+                    local_times[schedule_tz] = get_local_day_and_time(now, schedule_tz)
+                results.append((do_power_control(instance_dict, tags, local_times[schedule_tz]), instance_dict))
+    return results
+
+
+def stop_instances(region: str, instance_ids: list[str]):
+    ec2 = boto3.session.Session().client('ec2', region_name=region)
+    try:
+        ec2.stop_instances(InstanceIds=instance_ids)
+    except botocore.exceptions.ClientError as e:
+        log.critical(e)
+        log.critical(f'Could not stop instances in {region}')
 
 
 def main_job():
@@ -301,76 +419,96 @@ def main_job():
 
     session = boto3.session.Session()
     results = collections.defaultdict(list)
-    for region in session.get_available_regions('ec2'):
-        log.info(f'Checking {region}')
-        ec2 = boto3.resource('ec2', region_name=region)
-        try:
-            for instance in ec2.instances.all():
-                reason = do_power_control(instance)
-                results_for_reason = results[reason]
-                results_for_reason.append(get_instance_dict(instance, region))
-                results[reason] = results_for_reason
-        except botocore.exceptions.ClientError as e:
-            log.critical(e)
-            log.critical(f'Skipping {region}')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        futures = {executor.submit(scan_region, region, now): region for region in session.get_available_regions('ec2')}
+        for future in concurrent.futures.as_completed(futures):
+            region = futures[future]
+            try:
+                for reason, instance_dict in future.result():
+                    results[reason].append(instance_dict)
+            except botocore.exceptions.ClientError as e:
+                log.critical(e)
+                log.critical(f'Skipping {region}')
 
     instances_to_stop = results[PowerControlReason.DAY_MISMATCH] + results[PowerControlReason.TIME_MISMATCH]
     instances_to_notify = process_notification_times(instances_to_stop, now)
-    instances_to_notify_grouped = group_by_owner(instances_to_notify)
+    instances_to_notify_grouped = group_by(instances_to_notify, 'owner')
 
-    notified_owners = []
-    problem_owners = []
+    owner_template = jinja_env.get_template('owner-notification.html')
+    admin_template = jinja_env.get_template('admin-report.html')
+
+    owner_reports = {}
     for owner, instances in instances_to_notify_grouped.items():
-        # Notify owners that instances are going to be stopped
-        owner_template = jinja_env.get_template('owner-notification.html')
         ctx = {
             'config': c,
             'instances': instances
         }
-        owner_report = owner_template.render(ctx=ctx)
-        success = send_email(c.smtp_from, owner, 'Automatically stopping your environments', owner_report)
-        if success:
-            notified_owners.append(owner)
+        owner_reports[owner] = owner_template.render(ctx=ctx)
+
+    notified_owners = []
+    problem_owners = []
+    # Only connect to the mail server if there is something to send over SMTP
+    use_smtp = instances_to_notify and not c.aws_ses_template
+    with smtp_session() if use_smtp else contextlib.nullcontext() as conn:
+        # Notify owners that instances are going to be stopped
+        owner_subject = 'Automatically stopping your environments'
+        if c.aws_ses_template:
+            owner_results = send_bulk_email(c.smtp_from, owner_reports, owner_subject)
         else:
-            problem_owners.append(owner)
+            owner_results = {
+                owner: send_email(c.smtp_from, owner, owner_subject, owner_report, conn)
+                for owner, owner_report in owner_reports.items()
+            }
+        for owner, success in owner_results.items():
+            if success:
+                notified_owners.append(owner)
+            else:
+                problem_owners.append(owner)
 
-    admin_template = jinja_env.get_template('admin-report.html')
-    ctx = {
-        'config': c,
-        'instances_allowed': results[PowerControlReason.ALLOWED],
-        'instances_malformed_exist': len(results[PowerControlReason.MALFORMED]) > 0,
-        'instances_malformed': results[PowerControlReason.MALFORMED],
-        'instances_invalid_zone': results[PowerControlReason.INVALID_ZONE],
-        'instances_no_owner_exist': len(results[PowerControlReason.NO_OWNER]) > 0,
-        'instances_no_owner': results[PowerControlReason.NO_OWNER],
-        'instances_not_running': results[PowerControlReason.NOT_RUNNING],
-        'instances_protected_owner': results[PowerControlReason.PROTECTED_OWNER],
-        'instances_to_stop': instances_to_stop,
-        'notified_owners': notified_owners,
-        'notified_owners_exist': len(notified_owners) > 0,
-        'problem_owners': problem_owners,
-        'problem_owners_exist': len(problem_owners) > 0,
-        'run_time': f'{now:%A} ({current_day}) {current_time:%H:%M}'
-    }
-    admin_report = admin_template.render(ctx=ctx)
-    if len(instances_to_notify) > 0:
-        send_email(c.smtp_from, c.admin_email, 'Technical Sales Power Control Run Report', admin_report)
+        ctx = {
+            'config': c,
+            'instances_allowed': results[PowerControlReason.ALLOWED],
+            'instances_malformed_exist': len(results[PowerControlReason.MALFORMED]) > 0,
+            'instances_malformed': results[PowerControlReason.MALFORMED],
+            'instances_invalid_zone': results[PowerControlReason.INVALID_ZONE],
+            'instances_no_owner_exist': len(results[PowerControlReason.NO_OWNER]) > 0,
+            'instances_no_owner': results[PowerControlReason.NO_OWNER],
+            'instances_protected_owner': results[PowerControlReason.PROTECTED_OWNER],
+            'instances_to_stop': instances_to_stop,
+            'notified_owners': notified_owners,
+            'notified_owners_exist': len(notified_owners) > 0,
+            'problem_owners': problem_owners,
+            'problem_owners_exist': len(problem_owners) > 0,
+            'run_time': f'{now:%A} ({current_day}) {current_time:%H:%M}'
+        }
+        admin_report = admin_template.render(ctx=ctx)
+        admin_subject = 'Technical Sales Power Control Run Report'
+        if len(instances_to_notify) > 0:
+            if c.aws_ses_template:
+                send_bulk_email(c.smtp_from, {c.admin_email: admin_report}, admin_subject)
+            else:
+                send_email(c.smtp_from, c.admin_email, admin_subject, admin_report, conn)
 
     if not c.dry_run:
-        for region, instances in group_by_region(instances_to_stop).items():
-            ec2 = boto3.resource('ec2', region_name=region)
-            ec2.instances.filter(InstanceIds=[i['id'] for i in instances]).stop()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [
+                executor.submit(stop_instances, region, [i['id'] for i in instances])
+                for region, instances in group_by(instances_to_stop, 'region').items()
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                # re-raise anything unexpected from the worker
+                future.result()
 
 
 def main():
     logging.basicConfig(format=c.log_format, level=logging.DEBUG, stream=sys.stdout)
-    log.debug(f'power-control {c.version}')
+    log.debug('power-control %s', c.version)
     if not c.log_level == 'DEBUG':
-        log.debug(f'Setting log level to {c.log_level}')
+        log.debug('Setting log level to %s', c.log_level)
     logging.getLogger().setLevel(c.log_level)
 
-    log.info(f'PROTECTED_OWNERS: {c.protected_owners}')
-    log.info(f'TZ: {c.tz}')
+    log.info('PROTECTED_OWNERS: %s', sorted(c.protected_owners))
+    log.info('TZ: %s', c.tz)
 
     if c.immediate:
         main_job()